@@ -10,26 +10,50 @@ class Settings(BaseSettings):
     # Ollama Configuration
     ollama_base_url: str = "http://localhost:11434"
     ollama_model: str = "llama3.2"
+    ollama_keep_alive: str = "1h"
+    ollama_timeout: float = 120.0
+    ollama_max_connections: int = 50
+    ollama_max_keepalive_connections: int = 20
     
     # ChromaDB Configuration
     chroma_persist_dir: str = "./chroma_db"
     chroma_collection_name: str = "ecommerce_docs"
+    hnsw_batch_size: int = 1000
+    hnsw_sync_threshold: int = 10000
+    hnsw_m: int = 16
+    hnsw_construction_ef: int = 200
+    hnsw_search_ef: Optional[int] = None  # Defaults to max(32, top_k_results * 8)
     
     # Embedding Model Configuration
     embedding_model: str = "sentence-transformers/all-MiniLM-L6-v2"
+    embedding_batch_size: int = 64
+    embedding_backend: str = "sentence-transformers"  # or "onnx-int8"
+    
+    # Query Embedding Batching Configuration
+    query_batch_flush_ms: float = 5.0
+    query_batch_max_size: int = 32
     
     # Document Processing Configuration
     chunk_size: int = 500
     chunk_overlap: int = 100
     upload_dir: str = "./uploads"
+    pdf_workers: Optional[int] = None  # Defaults to CPU count
     
     # API Configuration
     api_host: str = "0.0.0.0"
     api_port: int = 8000
+    health_refresh_seconds: float = 10.0
+    worker_threads: Optional[int] = None  # Defaults to CPU count + 4 (max 32)
+    warmup_on_startup: bool = True
     
     # Retrieval Configuration
     top_k_results: int = 3
     
+    # Cache Configuration
+    query_embedding_cache_size: int = 1024
+    answer_cache_size: int = 512
+    answer_cache_ttl_seconds: float = 300.0
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -0,0 +1,105 @@
+"""ASGI interceptor that answers health probes from a cached payload."""
+
+import asyncio
+import json
+from typing import Awaitable, Callable, Dict, Optional
+
+
+class HealthCheckInterceptor:
+    """Serves health probes ahead of the FastAPI middleware stack.
+    
+    Requests for the health path do not reach the wrapped application;
+    they are answered with a pre-encoded JSON body that a background task
+    refreshes periodically. Every other request is passed through.
+    """
+    
+    def __init__(
+        self,
+        app,
+        probe: Callable[[], Awaitable[Dict]],
+        path: str = "/health",
+        interval: float = 10.0
+    ):
+        """Initialize the interceptor.
+        
+        Args:
+            app: ASGI application to wrap
+            probe: Coroutine function returning the current health payload
+            path: Request path answered from the cache
+            interval: Seconds between background probes
+        """
+        self.app = app
+        self.probe = probe
+        self.path = path
+        self.interval = interval
+        self.status: Dict = {}
+        self._body = b"{}"
+        self._task: Optional[asyncio.Task] = None
+    
+    def update(self, status: Dict):
+        """Replace the cached payload.
+        
+        Args:
+            status: JSON-serializable health payload
+        """
+        self.status = status
+        self._body = json.dumps(status).encode("utf-8")
+    
+    async def refresh(self):
+        """Run the probe once and cache its result."""
+        try:
+            self.update(await self.probe())
+        except Exception as e:
+            print(f"Health probe failed: {str(e)}")
+    
+    async def _refresh_forever(self):
+        """Re-run the probe every interval."""
+        while True:
+            await self.refresh()
+            await asyncio.sleep(self.interval)
+    
+    async def start(self):
+        """Start the background refresh task."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_forever())
+    
+    async def stop(self):
+        """Stop the background refresh task."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+    
+    async def __call__(self, scope, receive, send):
+        """ASGI entrypoint.
+        
+        Until the first probe completes, health requests fall through to
+        the wrapped application. Cross-origin requests always do, so the
+        CORS middleware can add its headers.
+        """
+        if (
+            self.status
+            and scope["type"] == "http"
+            and scope["path"] == self.path
+            and scope["method"] in ("GET", "HEAD")
+            and not any(name == b"origin" for name, _ in scope["headers"])
+        ):
+            body = self._body
+            await send({
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("ascii")),
+                ],
+            })
+            await send({
+                "type": "http.response.body",
+                "body": body if scope["method"] == "GET" else b"",
+            })
+            return
+        
+        await self.app(scope, receive, send)
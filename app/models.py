@@ -14,6 +14,12 @@ class DocumentUploadResponse(BaseModel):
     message: str = Field(default="Document uploaded and indexed successfully")
 
 
+class BatchUploadResponse(BaseModel):
+    """Response model for uploading several documents at once."""
+    documents: List[DocumentUploadResponse]
+    total_count: int
+
+
 class QueryRequest(BaseModel):
     """Request model for Q&A queries."""
     query: str = Field(..., description="User's question", min_length=1)
@@ -64,3 +70,4 @@ class HealthResponse(BaseModel):
     timestamp: str
     ollama_available: bool
     chroma_available: bool
+    answer_cache_hit_ratio: Optional[float] = None
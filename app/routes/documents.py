@@ -1,88 +1,258 @@
 """API routes for document management."""
 
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from datetime import datetime
-from typing import List
+import asyncio
+from fastapi import APIRouter, BackgroundTasks, UploadFile, File, HTTPException
+from typing import Dict, List
 
 from app.models import (
     DocumentUploadResponse,
+    BatchUploadResponse,
     DocumentListResponse,
     DocumentInfo,
     DeleteDocumentResponse
 )
-from app.utils.file_handlers import save_upload_file, delete_upload_file
-from app.services.document_processor import DocumentProcessor
-from app.services.embeddings import EmbeddingService
-from app.services.vector_store import VectorStore
+from app.utils.file_handlers import read_upload_file, save_upload_bytes
+from app.services.registry import document_processor, embedding_service, vector_store
 from app.config import settings
 
 # Initialize router
 router = APIRouter(prefix="/api/documents", tags=["documents"])
 
-# Initialize services (these will be shared across requests)
-document_processor = DocumentProcessor(
-    chunk_size=settings.chunk_size,
-    chunk_overlap=settings.chunk_overlap
-)
-embedding_service = EmbeddingService(model_name=settings.embedding_model)
-vector_store = VectorStore(
-    persist_directory=settings.chroma_persist_dir,
-    collection_name=settings.chroma_collection_name
-)
+# Documents currently being indexed, so concurrent uploads of the same
+# content wait for the first one instead of indexing it again
+_in_flight: Dict[str, asyncio.Event] = {}
+_in_flight_lock = asyncio.Lock()
+
+
+async def _claim_documents(doc_ids: List[str]) -> Dict[str, Dict]:
+    """Claim document IDs for indexing, skipping those already indexed.
+    
+    If another request is indexing any of the IDs, waits for it to finish
+    and checks again. The IDs are then claimed together, so a request
+    never waits while holding a claim and overlapping batches cannot
+    deadlock.
+    
+    Args:
+        doc_ids: Distinct content-hash document IDs
+        
+    Returns:
+        Metadata of the IDs that are already indexed; every other ID is now
+        claimed by the caller and must be released with _release_documents
+    """
+    while True:
+        async with _in_flight_lock:
+            pending = next((_in_flight[d] for d in doc_ids if d in _in_flight), None)
+            if pending is None:
+                existing = {}
+                for doc_id in doc_ids:
+                    document = vector_store.get_document(doc_id)
+                    if document is not None:
+                        existing[doc_id] = document
+                    else:
+                        _in_flight[doc_id] = asyncio.Event()
+                return existing
+        
+        await pending.wait()
+
+
+async def _release_documents(doc_ids: List[str]):
+    """Release document IDs claimed with _claim_documents.
+    
+    Args:
+        doc_ids: Document IDs claimed by the caller
+    """
+    async with _in_flight_lock:
+        released = [_in_flight.pop(doc_id) for doc_id in doc_ids if doc_id in _in_flight]
+    for pending in released:
+        pending.set()
 
 
 @router.post("/upload", response_model=DocumentUploadResponse, status_code=201)
-async def upload_document(file: UploadFile = File(...)):
+async def upload_document(background_tasks: BackgroundTasks, file: UploadFile = File(...)):
     """
     Upload and index a document.
     
     Supports: .txt, .md, .pdf files
     
     Process:
-    1. Save uploaded file
-    2. Extract text and create chunks
-    3. Generate embeddings
-    4. Store in vector database
+    1. Read uploaded file into memory
+    2. Return the existing document if identical content is already indexed
+    3. Extract text and create chunks
+    4. Generate embeddings
+    5. Store in vector database
+    6. Save the original file to the upload directory in the background
     
     Returns:
         DocumentUploadResponse with document ID and metadata
     """
     try:
-        # Save the uploaded file
-        file_path, doc_id = await save_upload_file(file, settings.upload_dir)
+        # Read the uploaded file
+        data, doc_id = await read_upload_file(file)
         
-        # Process the document (extract text and chunk)
-        chunks, metadata = document_processor.process_document(
-            file_path=file_path,
-            document_id=doc_id,
-            filename=file.filename
-        )
+        # Document IDs are content hashes, so a re-upload needs no re-indexing
+        existing = (await _claim_documents([doc_id])).get(doc_id)
+        if existing is not None:
+            return DocumentUploadResponse(
+                document_id=doc_id,
+                filename=existing['filename'],
+                chunk_count=existing['chunk_count'],
+                upload_time=existing['upload_time'],
+                message="Document already indexed"
+            )
         
-        if not chunks:
-            # Clean up file if no chunks were created
-            delete_upload_file(file_path)
-            raise HTTPException(
-                status_code=400,
-                detail="No text content could be extracted from the document"
+        try:
+            # Process the document (extract text and chunk) off the event loop
+            chunks, metadata = await asyncio.to_thread(
+                document_processor.process_document_bytes,
+                data,
+                doc_id,
+                file.filename
+            )
+            
+            if not chunks:
+                raise HTTPException(
+                    status_code=400,
+                    detail="No text content could be extracted from the document"
+                )
+            
+            # Generate embeddings for all chunks
+            embeddings = await asyncio.to_thread(embedding_service.generate_embeddings, chunks)
+            
+            # Store in vector database
+            await vector_store.aadd_documents(
+                chunks=chunks,
+                embeddings=embeddings,
+                document_id=doc_id,
+                filename=file.filename,
+                upload_time=metadata['upload_time']
+            )
+            
+            # Keep the original file for auditing without delaying the response
+            background_tasks.add_task(
+                save_upload_bytes,
+                data,
+                settings.upload_dir,
+                doc_id,
+                file.filename
             )
+            
+            return DocumentUploadResponse(
+                document_id=doc_id,
+                filename=file.filename,
+                chunk_count=len(chunks),
+                upload_time=metadata['upload_time']
+            )
+        finally:
+            await _release_documents([doc_id])
+    
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process document: {str(e)}"
+        )
+
+
+@router.post("/upload/batch", response_model=BatchUploadResponse, status_code=201)
+async def upload_documents_batch(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...)):
+    """
+    Upload and index several documents in one request.
+    
+    Supports: .txt, .md, .pdf files
+    
+    Intended for bulk ingest: the chunks of every new document are embedded
+    together and written to the vector database in a single batched add,
+    instead of one embedding pass and one write per document.
+    
+    Returns:
+        BatchUploadResponse with one entry per uploaded file
+    """
+    try:
+        uploads = []
+        for file in files:
+            data, doc_id = await read_upload_file(file)
+            uploads.append((file, data, doc_id))
         
-        # Generate embeddings for all chunks
-        embeddings = embedding_service.generate_embeddings(chunks)
+        # Content that is already indexed is not embedded again
+        doc_ids = list(dict.fromkeys(doc_id for _, _, doc_id in uploads))
+        existing = await _claim_documents(doc_ids)
+        claimed = [doc_id for doc_id in doc_ids if doc_id not in existing]
         
-        # Store in vector database
-        vector_store.add_documents(
-            chunks=chunks,
-            embeddings=embeddings,
-            document_id=doc_id,
-            filename=file.filename,
-            upload_time=metadata['upload_time']
-        )
+        responses = []
+        new_documents = {}
+        try:
+            for file, data, doc_id in uploads:
+                # Identical content already indexed, or earlier in this batch
+                document = existing.get(doc_id)
+                if document is None and doc_id in new_documents:
+                    document = new_documents[doc_id]["response"].model_dump()
+                if document is not None:
+                    responses.append(DocumentUploadResponse(
+                        document_id=doc_id,
+                        filename=document['filename'],
+                        chunk_count=document['chunk_count'],
+                        upload_time=document['upload_time'],
+                        message="Document already indexed"
+                    ))
+                    continue
+                
+                chunks, metadata = await asyncio.to_thread(
+                    document_processor.process_document_bytes,
+                    data,
+                    doc_id,
+                    file.filename
+                )
+                
+                if not chunks:
+                    raise HTTPException(
+                        status_code=400,
+                        detail=f"No text content could be extracted from {file.filename}"
+                    )
+                
+                response = DocumentUploadResponse(
+                    document_id=doc_id,
+                    filename=file.filename,
+                    chunk_count=len(chunks),
+                    upload_time=metadata['upload_time']
+                )
+                new_documents[doc_id] = {"data": data, "chunks": chunks, "response": response}
+                responses.append(response)
+            
+            if new_documents:
+                # Embed every new chunk in one pass, then split per document
+                all_chunks = [chunk for doc in new_documents.values() for chunk in doc["chunks"]]
+                embeddings = await asyncio.to_thread(embedding_service.generate_embeddings, all_chunks)
+                
+                batch = []
+                offset = 0
+                for doc_id, doc in new_documents.items():
+                    end = offset + len(doc["chunks"])
+                    batch.append((
+                        doc["chunks"],
+                        embeddings[offset:end],
+                        doc_id,
+                        doc["response"].filename,
+                        doc["response"].upload_time
+                    ))
+                    offset = end
+                
+                await vector_store.aadd_documents_batch(batch)
+                
+                for doc_id, doc in new_documents.items():
+                    background_tasks.add_task(
+                        save_upload_bytes,
+                        doc["data"],
+                        settings.upload_dir,
+                        doc_id,
+                        doc["response"].filename
+                    )
+        finally:
+            await _release_documents(claimed)
         
-        return DocumentUploadResponse(
-            document_id=doc_id,
-            filename=file.filename,
-            chunk_count=len(chunks),
-            upload_time=metadata['upload_time']
+        return BatchUploadResponse(
+            documents=responses,
+            total_count=len(responses)
         )
     
     except HTTPException:
@@ -90,7 +260,7 @@ async def upload_document(file: UploadFile = File(...)):
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to process document: {str(e)}"
+            detail=f"Failed to process documents: {str(e)}"
         )
 
 
@@ -141,7 +311,7 @@ async def delete_document(document_id: str):
     """
     try:
         # Delete from vector store
-        deleted_count = vector_store.delete_document(document_id)
+        deleted_count = await vector_store.adelete_document(document_id)
         
         if deleted_count == 0:
             raise HTTPException(
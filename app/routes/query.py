@@ -1,26 +1,49 @@
 """API routes for Q&A queries."""
 
+import asyncio
+import json
 from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+from typing import Dict
 
 from app.models import QueryRequest, QueryResponse
-from app.services.embeddings import EmbeddingService
-from app.services.vector_store import VectorStore
-from app.services.rag_pipeline import RAGPipeline
+from app.services.rag_pipeline import GENERATION_ERROR_PREFIX
+from app.services.registry import answer_cache, embedding_batcher, vector_store, rag_pipeline
 from app.config import settings
+from app.utils.timestamps import now_iso
 
 # Initialize router
 router = APIRouter(prefix="/api", tags=["query"])
 
-# Initialize services
-embedding_service = EmbeddingService(model_name=settings.embedding_model)
-vector_store = VectorStore(
-    persist_directory=settings.chroma_persist_dir,
-    collection_name=settings.chroma_collection_name
-)
-rag_pipeline = RAGPipeline(
-    ollama_base_url=settings.ollama_base_url,
-    model_name=settings.ollama_model
-)
+
+async def _retrieve(request: QueryRequest) -> Dict:
+    """Embed the query and retrieve relevant chunks.
+    
+    Args:
+        request: QueryRequest with user's question
+        
+    Returns:
+        Search results from the vector store
+        
+    Raises:
+        HTTPException: If no documents have been indexed
+    """
+    # Check if there are any documents indexed
+    if vector_store.get_chunk_count() == 0:
+        raise HTTPException(
+            status_code=400,
+            detail="No documents have been indexed yet. Please upload documents first."
+        )
+    
+    # Generate embedding for the query
+    query_embedding = await embedding_batcher.embed(request.query)
+    
+    # Retrieve relevant documents from vector store
+    top_k = request.top_k if request.top_k else settings.top_k_results
+    return await vector_store.asearch(
+        query_embedding=query_embedding,
+        top_k=top_k
+    )
 
 
 @router.post("/query", response_model=QueryResponse)
@@ -29,9 +52,10 @@ async def query_documents(request: QueryRequest):
     Ask a question about the indexed documents.
     
     Process:
-    1. Generate embedding for the query
-    2. Retrieve relevant chunks from vector store
-    3. Generate answer using RAG pipeline
+    1. Return a cached answer if this question was answered recently
+    2. Generate embedding for the query
+    3. Retrieve relevant chunks from vector store
+    4. Generate answer using RAG pipeline
     
     Args:
         request: QueryRequest with user's question
@@ -40,29 +64,27 @@ async def query_documents(request: QueryRequest):
         QueryResponse with answer and source documents
     """
     try:
-        # Check if there are any documents indexed
-        if vector_store.get_chunk_count() == 0:
-            raise HTTPException(
-                status_code=400,
-                detail="No documents have been indexed yet. Please upload documents first."
-            )
-        
-        # Generate embedding for the query
-        query_embedding = embedding_service.generate_embedding(request.query)
-        
-        # Retrieve relevant documents from vector store
+        # Serve repeated questions from the cache while the corpus is unchanged
         top_k = request.top_k if request.top_k else settings.top_k_results
-        search_results = vector_store.search(
-            query_embedding=query_embedding,
-            top_k=top_k
-        )
+        cache_key = answer_cache.make_key(request.query, top_k, vector_store.version)
+        cached = await answer_cache.get(cache_key)
+        if cached is not None:
+            # The key is case- and whitespace-insensitive; echo this request's
+            # query and stamp the response with the time it is served
+            return QueryResponse(**{**cached, "query": request.query, "timestamp": now_iso()})
+        
+        search_results = await _retrieve(request)
         
         # Generate response using RAG pipeline
-        response_data = rag_pipeline.generate_response(
+        response_data = await asyncio.to_thread(
+            rag_pipeline.generate_response,
             query=request.query,
             search_results=search_results
         )
         
+        if not response_data["answer"].startswith(GENERATION_ERROR_PREFIX):
+            await answer_cache.set(cache_key, response_data)
+        
         # Convert to response model
         return QueryResponse(**response_data)
     
@@ -73,3 +95,38 @@ async def query_documents(request: QueryRequest):
             status_code=500,
             detail=f"Failed to process query: {str(e)}"
         )
+
+
+@router.post("/query/stream")
+async def query_documents_stream(request: QueryRequest):
+    """
+    Ask a question and stream the answer as it is generated.
+    
+    Responds with newline-delimited JSON: one {"type": "token"} line per
+    generated piece of the answer, followed by a {"type": "done"} line
+    with the source documents.
+    
+    Args:
+        request: QueryRequest with user's question
+        
+    Returns:
+        StreamingResponse of application/x-ndjson events
+    """
+    try:
+        search_results = await _retrieve(request)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500,
+            detail=f"Failed to process query: {str(e)}"
+        )
+    
+    events = rag_pipeline.stream_response(
+        query=request.query,
+        search_results=search_results
+    )
+    return StreamingResponse(
+        (json.dumps(event) + "\n" for event in events),
+        media_type="application/x-ndjson"
+    )
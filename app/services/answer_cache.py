@@ -0,0 +1,75 @@
+"""TTL cache for generated RAG answers."""
+
+import asyncio
+import hashlib
+from typing import Dict, Hashable, Optional, Tuple
+
+from cachetools import TTLCache
+
+
+class AnswerCache:
+    """Caches full query responses so repeated questions skip the pipeline.
+    
+    Keys include the corpus version of the vector store, so any upload or
+    deletion makes earlier answers unreachable.
+    """
+    
+    def __init__(self, maxsize: int = 512, ttl: float = 300.0):
+        """Initialize the answer cache.
+        
+        Args:
+            maxsize: Maximum number of cached answers
+            ttl: Seconds before a cached answer expires
+        """
+        self._cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        self._lock = asyncio.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def make_key(query: str, top_k: int, corpus_version: int) -> Tuple[Hashable, ...]:
+        """Build the cache key for a query.
+        
+        Args:
+            query: User's question
+            top_k: Number of chunks retrieved for the answer
+            corpus_version: Vector store version the answer was built from
+            
+        Returns:
+            Hashable cache key
+        """
+        query_hash = hashlib.sha1(query.strip().lower().encode("utf-8")).hexdigest()
+        return (query_hash, top_k, corpus_version)
+    
+    async def get(self, key: Tuple[Hashable, ...]) -> Optional[Dict]:
+        """Look up a cached answer.
+        
+        Args:
+            key: Key from make_key
+            
+        Returns:
+            Cached response data, or None on a miss
+        """
+        async with self._lock:
+            value = self._cache.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return value
+    
+    async def set(self, key: Tuple[Hashable, ...], value: Dict):
+        """Store an answer.
+        
+        Args:
+            key: Key from make_key
+            value: Response data to cache
+        """
+        async with self._lock:
+            self._cache[key] = value
+    
+    @property
+    def hit_ratio(self) -> Optional[float]:
+        """Fraction of lookups served from the cache, or None before any lookup."""
+        total = self.hits + self.misses
+        return round(self.hits / total, 3) if total else None
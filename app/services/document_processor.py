@@ -1,29 +1,102 @@
 """Document processing service for text extraction and chunking."""
 
+import io
+import multiprocessing
 import os
-from typing import List, Tuple
-from datetime import datetime
-from pypdf import PdfReader
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import List, Optional, Tuple, Union
+
+from app.utils.timestamps import now_iso
+
+
+# PDFs shorter than this are extracted in-process; spawning workers costs more
+PARALLEL_PDF_MIN_PAGES = 16
+
+
+def _open_pdf(data: Union[bytes, bytearray]):
+    """Open a PDF from its raw bytes.
+    
+    Args:
+        data: The file contents
+        
+    Returns:
+        pypdf.PdfReader for the document
+    """
+    from pypdf import PdfReader
+    
+    return PdfReader(io.BytesIO(data))
+
+
+def _extract_page_range(args: Tuple[str, int, int, int]) -> List[str]:
+    """Extract text from a contiguous range of PDF pages.
+    
+    Runs inside a worker process. The PDF is read from a shared memory
+    block rather than pickled to every worker.
+    
+    Args:
+        args: Tuple of (shared memory name, PDF size in bytes, first page,
+            page after the last)
+        
+    Returns:
+        Text of each page in the range
+    """
+    shm_name, size, start, stop = args
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        reader = _open_pdf(bytes(shm.buf[:size]))
+    finally:
+        shm.close()
+    return [reader.pages[i].extract_text() for i in range(start, stop)]
 
 
 class DocumentProcessor:
     """Handles document upload, text extraction, and chunking."""
     
-    def __init__(self, chunk_size: int = 500, chunk_overlap: int = 50):
+    def __init__(
+        self,
+        chunk_size: int = 500,
+        chunk_overlap: int = 50,
+        pdf_workers: Optional[int] = None
+    ):
         """Initialize document processor.
         
         Args:
             chunk_size: Size of each text chunk in characters
             chunk_overlap: Number of overlapping characters between chunks
+            pdf_workers: Worker processes for PDF extraction (defaults to CPU count)
         """
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
+        self.pdf_workers = pdf_workers or os.cpu_count() or 1
+        self._pdf_pool: Optional[ProcessPoolExecutor] = None
+    
+    def start(self):
+        """Start the worker pool used to extract large PDFs.
+        
+        Workers are spawned rather than forked: forking the multi-threaded
+        server process can deadlock, and one long-lived pool avoids paying
+        process startup on every upload. Until this is called, PDFs are
+        extracted in-process.
+        """
+        if self._pdf_pool is None and self.pdf_workers > 1:
+            self._pdf_pool = ProcessPoolExecutor(
+                max_workers=self.pdf_workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+    
+    def shutdown(self):
+        """Stop the PDF worker pool."""
+        if self._pdf_pool is not None:
+            self._pdf_pool.shutdown(wait=True, cancel_futures=True)
+            self._pdf_pool = None
     
-    def extract_text(self, file_path: str) -> str:
-        """Extract text from different file formats.
+    def extract_text_from_bytes(self, data: Union[bytes, bytearray], ext: str) -> str:
+        """Extract text from in-memory file contents.
         
         Args:
-            file_path: Path to the file
+            data: Raw file contents
+            ext: Lowercase file extension including the dot, e.g. ".pdf"
             
         Returns:
             Extracted text content
@@ -31,53 +104,68 @@ class DocumentProcessor:
         Raises:
             ValueError: If file format is not supported
         """
-        _, ext = os.path.splitext(file_path.lower())
-        
         if ext == '.pdf':
-            return self._extract_from_pdf(file_path)
+            return self._extract_from_pdf(data)
         elif ext in ['.txt', '.md']:
-            return self._extract_from_text(file_path)
+            try:
+                text = str(data, 'utf-8')
+            except UnicodeDecodeError as e:
+                raise ValueError(f"Failed to read text file: {str(e)}")
+            # Match the newline translation of reading the file in text mode
+            return text.replace('\r\n', '\n').replace('\r', '\n').strip()
         else:
             raise ValueError(f"Unsupported file format: {ext}")
     
-    def _extract_from_pdf(self, file_path: str) -> str:
+    def _extract_from_pdf(self, data: Union[bytes, bytearray]) -> str:
         """Extract text from PDF file.
         
+        pypdf's extractor is pure Python and holds the GIL, so large PDFs
+        are split into page ranges and extracted in the worker pool.
+        
         Args:
-            file_path: Path to PDF file
+            data: Raw PDF contents
             
         Returns:
             Extracted text
         """
         try:
-            reader = PdfReader(file_path)
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-            return text.strip()
-        except Exception as e:
-            raise ValueError(f"Failed to extract text from PDF: {str(e)}")
-    
-    def _extract_from_text(self, file_path: str) -> str:
-        """Extract text from text/markdown file.
-        
-        Args:
-            file_path: Path to text file
+            reader = _open_pdf(data)
+            page_count = len(reader.pages)
+            workers = min(self.pdf_workers, page_count)
             
-        Returns:
-            File contents
-        """
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read().strip()
+            if self._pdf_pool is None or page_count < PARALLEL_PDF_MIN_PAGES or workers <= 1:
+                texts = [page.extract_text() for page in reader.pages]
+            else:
+                # Workers read the PDF from shared memory
+                shm = shared_memory.SharedMemory(create=True, size=len(data))
+                try:
+                    shm.buf[:len(data)] = data
+                    
+                    # One contiguous page range per worker
+                    bounds = [page_count * w // workers for w in range(workers + 1)]
+                    ranges = [
+                        (shm.name, len(data), bounds[w], bounds[w + 1])
+                        for w in range(workers)
+                    ]
+                    texts = [
+                        text
+                        for part in self._pdf_pool.map(_extract_page_range, ranges)
+                        for text in part
+                    ]
+                finally:
+                    shm.close()
+                    shm.unlink()
+            
+            return "\n".join(texts).strip()
         except Exception as e:
-            raise ValueError(f"Failed to read text file: {str(e)}")
+            raise ValueError(f"Failed to extract text from PDF: {str(e)}")
     
     def chunk_text(self, text: str) -> List[str]:
         """Split text into overlapping chunks.
         
         Uses a sliding window approach to create chunks with overlap
-        for better context preservation.
+        for better context preservation. The text is stripped once up
+        front rather than trimming every window.
         
         Args:
             text: Text to chunk
@@ -85,42 +173,40 @@ class DocumentProcessor:
         Returns:
             List of text chunks
         """
+        text = text.strip()
         if not text:
             return []
         
-        chunks = []
-        text_length = len(text)
+        size = self.chunk_size
         
         # Calculate step size (chunk_size - overlap)
-        step = self.chunk_size - self.chunk_overlap
+        step = size - self.chunk_overlap
         
-        # Create chunks using sliding window
-        for i in range(0, text_length, step):
-            chunk = text[i:i + self.chunk_size]
-            
-            # Only add non-empty chunks
-            if chunk.strip():
-                chunks.append(chunk.strip())
-            
-            # Break if we've reached the end
-            if i + self.chunk_size >= text_length:
-                break
+        # The last window is the first one that reaches the end of the text
+        stop = max(len(text) - size, 0) + step
+        windows = (text[i:i + size] for i in range(0, stop, step))
         
-        return chunks
+        # Only keep windows with visible content
+        return [chunk for chunk in windows if not chunk.isspace()]
     
-    def process_document(self, file_path: str, document_id: str, filename: str) -> Tuple[List[str], dict]:
-        """Process a document: extract text and create chunks.
+    def process_document_bytes(self, data: Union[bytes, bytearray], document_id: str, filename: str) -> Tuple[List[str], dict]:
+        """Process an in-memory document: extract text and create chunks.
+        
+        Avoids writing the upload to disk and reading it back before
+        extraction.
         
         Args:
-            file_path: Path to the document file
+            data: Raw file contents
             document_id: Unique identifier for the document
-            filename: Original filename
+            filename: Original filename, used to detect the format
             
         Returns:
             Tuple of (chunks, metadata)
         """
+        _, ext = os.path.splitext(filename.lower())
+        
         # Extract text from document
-        text = self.extract_text(file_path)
+        text = self.extract_text_from_bytes(data, ext)
         
         # Create chunks
         chunks = self.chunk_text(text)
@@ -130,8 +216,7 @@ class DocumentProcessor:
             "document_id": document_id,
             "filename": filename,
             "chunk_count": len(chunks),
-            "upload_time": datetime.now().isoformat(),
-            "file_path": file_path
+            "upload_time": now_iso()
         }
         
         return chunks, metadata
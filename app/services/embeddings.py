@@ -1,64 +1,323 @@
 """Embedding generation service using sentence-transformers."""
 
-from sentence_transformers import SentenceTransformer
-from typing import List
+import asyncio
+import os
+import threading
+from typing import List, Optional, Tuple
 import numpy as np
+from cachetools import LRUCache
+
+
+# Maximum sequence length used by the MiniLM family of models
+ONNX_MAX_SEQ_LENGTH = 256
 
 
 class EmbeddingService:
     """Service for generating text embeddings."""
     
-    def __init__(self, model_name: str = "sentence-transformers/all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = "sentence-transformers/all-MiniLM-L6-v2",
+        batch_size: int = 64,
+        backend: str = "sentence-transformers",
+        cache_dir: str = "./chroma_db/models",
+        query_cache_size: int = 1024
+    ):
         """Initialize the embedding service.
         
         Args:
             model_name: Name of the sentence-transformers model to use
+            batch_size: Number of texts encoded per forward pass
+            backend: Either "sentence-transformers" (fp32 torch) or
+                "onnx-int8" (dynamically quantized ONNX Runtime model)
+            cache_dir: Directory where exported ONNX models are cached
+            query_cache_size: Number of query embeddings kept in the LRU cache
         """
+        if backend not in ("sentence-transformers", "onnx-int8"):
+            raise ValueError(f"Unsupported embedding backend: {backend}")
+        
         self.model_name = model_name
+        self.batch_size = batch_size
+        self.backend = backend
+        self.cache_dir = cache_dir
         self.model = None
-        self._load_model()
+        self.tokenizer = None
+        self.session = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self._query_cache = LRUCache(maxsize=query_cache_size)
+        self._query_cache_lock = threading.Lock()
+    
+    def _ensure_model(self):
+        """Load the model on first use.
+        
+        Deferring the load (and the torch import behind it) keeps app
+        startup fast; the lock stops concurrent first calls loading twice.
+        """
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self._load_model()
+                self._loaded = True
     
     def _load_model(self):
-        """Load the sentence-transformers model."""
-        print(f"Loading embedding model: {self.model_name}")
-        self.model = SentenceTransformer(self.model_name)
+        """Load the embedding model for the configured backend."""
+        print(f"Loading embedding model: {self.model_name} ({self.backend})")
+        if self.backend == "onnx-int8":
+            self._load_onnx_model()
+        else:
+            from sentence_transformers import SentenceTransformer
+            self.model = SentenceTransformer(self.model_name)
         print("Embedding model loaded successfully")
     
-    def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def _load_onnx_model(self):
+        """Load the int8 ONNX model, exporting and quantizing it on first use."""
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+        
+        model_dir = os.path.join(self.cache_dir, self.model_name.replace("/", "__"))
+        quantized_path = os.path.join(model_dir, "model_quantized.onnx")
+        
+        if not os.path.exists(quantized_path):
+            from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+            from optimum.onnxruntime.configuration import AutoQuantizationConfig
+            
+            print(f"Exporting {self.model_name} to ONNX at: {model_dir}")
+            ort_model = ORTModelForFeatureExtraction.from_pretrained(self.model_name, export=True)
+            ort_model.save_pretrained(model_dir)
+            AutoTokenizer.from_pretrained(self.model_name).save_pretrained(model_dir)
+            
+            quantizer = ORTQuantizer.from_pretrained(ort_model)
+            quantization_config = AutoQuantizationConfig.avx512_vnni(
+                is_static=False,
+                per_channel=True
+            )
+            quantizer.quantize(save_dir=model_dir, quantization_config=quantization_config)
+        
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self.session = ort.InferenceSession(
+            quantized_path,
+            providers=["CPUExecutionProvider"]
+        )
+        self._onnx_input_names = {i.name for i in self.session.get_inputs()}
+    
+    def _encode_onnx(self, texts: List[str]) -> np.ndarray:
+        """Encode texts with the ONNX session using mean pooling.
+        
+        Args:
+            texts: List of text strings to embed
+            
+        Returns:
+            L2-normalized embedding matrix
+        """
+        batches = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[start:start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=ONNX_MAX_SEQ_LENGTH,
+                return_tensors="np"
+            )
+            inputs = {k: v for k, v in encoded.items() if k in self._onnx_input_names}
+            token_embeddings = self.session.run(None, inputs)[0]
+            
+            # Mean-pool over real tokens only
+            mask = encoded["attention_mask"][..., np.newaxis].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            batches.append(summed / counts)
+        
+        embeddings = np.concatenate(batches, axis=0)
+        norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+        return embeddings / np.clip(norms, 1e-12, None)
+    
+    def _encode_torch(self, texts: List[str]) -> np.ndarray:
+        """Encode texts with the sentence-transformers model.
+        
+        Texts are sorted by length so each batch pads to a similar length,
+        tokenized per batch with the model's fast tokenizer, and run through
+        the model's modules under torch.inference_mode().
+        
+        Args:
+            texts: List of text strings to embed
+            
+        Returns:
+            L2-normalized embedding matrix in input order
+        """
+        import torch
+        
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        batches = []
+        with torch.inference_mode():
+            for start in range(0, len(texts), self.batch_size):
+                batch = [texts[i] for i in order[start:start + self.batch_size]]
+                features = self.model.tokenize(batch)
+                features = {k: v.to(self.model.device) for k, v in features.items()}
+                output = self.model(features)["sentence_embedding"]
+                output = torch.nn.functional.normalize(output, p=2, dim=1)
+                batches.append(output.float().cpu().numpy())
+        
+        # Undo the length sort
+        embeddings = np.empty((len(texts), batches[0].shape[1]), dtype=np.float32)
+        embeddings[order] = np.concatenate(batches, axis=0)
+        return embeddings
+    
+    def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """Generate embeddings for a list of texts.
         
         Args:
             texts: List of text strings to embed
             
         Returns:
-            List of embedding vectors
+            float32 matrix with one embedding vector per row
         """
         if not texts:
-            return []
+            return np.empty((0, 0), dtype=np.float32)
+        
+        self._ensure_model()
         
         # Generate embeddings
-        embeddings = self.model.encode(
-            texts,
-            convert_to_numpy=True,
-            show_progress_bar=False
-        )
+        if self.backend == "onnx-int8":
+            embeddings = self._encode_onnx(texts)
+        else:
+            embeddings = self._encode_torch(texts)
         
-        # Convert to list format for ChromaDB
-        return embeddings.tolist()
+        # ChromaDB accepts ndarrays directly, so skip the list round-trip
+        return embeddings.astype(np.float32, copy=False)
     
-    def generate_embedding(self, text: str) -> List[float]:
-        """Generate embedding for a single text.
+    @staticmethod
+    def _query_key(text: str) -> str:
+        """Normalize a query for cache lookups.
+        
+        Matching is case-insensitive; the default MiniLM model is uncased.
+        """
+        return text.strip().lower()
+    
+    def get_cached_embedding(self, text: str) -> Optional[np.ndarray]:
+        """Look up a previously generated query embedding.
+        
+        Args:
+            text: Query text
+            
+        Returns:
+            Cached embedding vector, or None on a miss
+        """
+        with self._query_cache_lock:
+            return self._query_cache.get(self._query_key(text))
+    
+    def cache_embedding(self, text: str, embedding: np.ndarray):
+        """Store a query embedding in the LRU cache.
+        
+        Args:
+            text: Query text
+            embedding: Embedding vector for the query
+        """
+        with self._query_cache_lock:
+            self._query_cache[self._query_key(text)] = embedding
+    
+    def generate_embedding(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text, using the query cache.
         
         Args:
             text: Text string to embed
             
         Returns:
-            Embedding vector as list
+            float32 embedding vector
         """
-        embedding = self.model.encode(
-            [text],
-            convert_to_numpy=True,
-            show_progress_bar=False
-        )
+        embedding = self.get_cached_embedding(text)
+        if embedding is None:
+            embedding = self.generate_embeddings([text])[0]
+            self.cache_embedding(text, embedding)
+        return embedding
+
+
+class EmbeddingBatcher:
+    """Coalesces concurrent query embeddings into a single forward pass.
+    
+    Requests are queued and a background task drains the queue after a
+    short flush window, encoding everything collected so far in one call
+    to the embedding service.
+    """
+    
+    def __init__(
+        self,
+        embedding_service: EmbeddingService,
+        flush_ms: float = 5.0,
+        max_batch: int = 32
+    ):
+        """Initialize the batcher.
         
-        return embedding[0].tolist()
+        Args:
+            embedding_service: Service used to encode each batch
+            flush_ms: How long to wait for more requests before encoding
+            max_batch: Maximum number of texts encoded per batch
+        """
+        self.embedding_service = embedding_service
+        self.flush_seconds = flush_ms / 1000.0
+        self.max_batch = max_batch
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+    
+    def _ensure_worker(self):
+        """Start the background worker on first use."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+    
+    async def embed(self, text: str) -> np.ndarray:
+        """Generate embedding for a single text, batched with concurrent calls.
+        
+        Args:
+            text: Text string to embed
+            
+        Returns:
+            float32 embedding vector
+        """
+        embedding = self.embedding_service.get_cached_embedding(text)
+        if embedding is not None:
+            return embedding
+        
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((text, future))
+        return await future
+    
+    async def _run(self):
+        """Drain the queue and encode pending texts in batches."""
+        while True:
+            batch: List[Tuple[str, asyncio.Future]] = [await self._queue.get()]
+            
+            # Give concurrent requests a moment to join this batch
+            await asyncio.sleep(self.flush_seconds)
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await asyncio.to_thread(
+                    self.embedding_service.generate_embeddings, texts
+                )
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            for (text, future), embedding in zip(batch, embeddings):
+                # Copy the row so the cache does not keep the whole batch alive
+                embedding = embedding.copy()
+                self.embedding_service.cache_embedding(text, embedding)
+                if not future.done():
+                    future.set_result(embedding)
+    
+    async def close(self):
+        """Stop the background worker."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
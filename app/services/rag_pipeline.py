@@ -1,8 +1,66 @@
 """RAG pipeline service integrating retrieval and generation."""
 
-import ollama
-from typing import List, Dict
-from datetime import datetime
+import time
+from typing import Any, List, Dict, Iterator, Optional
+
+import httpx
+
+from app.utils.timestamps import now_iso
+
+
+# Static instructions shared by every prompt; kept first so it is a stable prefix
+PROMPT_PREAMBLE = """You are a helpful AI assistant for an e-commerce platform. Answer the user's question based on the provided context from product documents.
+
+Instructions:
+- Answer the question using ONLY the information from the context below
+- If the context doesn't contain enough information to answer, say "I don't have enough information in the documents to answer this question."
+- Be concise and accurate
+- If referencing specific products or features, mention the source document
+
+"""
+
+# Fixed separators around the dynamic parts of the prompt
+PROMPT_CONTEXT_HEADER = "Context from documents:\n"
+PROMPT_QUESTION_HEADER = "\n\nUser Question: "
+PROMPT_ANSWER_SUFFIX = "\n\nAnswer:"
+
+# Prefix of the answer returned when generation fails
+GENERATION_ERROR_PREFIX = "Error generating response"
+
+# Sampling options shared by blocking and streaming generation
+GENERATION_OPTIONS = {
+    "temperature": 0.7,
+    "num_predict": 512,
+}
+
+
+def create_ollama_client(
+    base_url: str,
+    timeout: float = 120.0,
+    max_connections: int = 50,
+    max_keepalive_connections: int = 20
+):
+    """Create an Ollama client backed by a pooled HTTP connection.
+    
+    Args:
+        base_url: Base URL for Ollama API
+        timeout: Request timeout in seconds
+        max_connections: Maximum concurrent connections to Ollama
+        max_keepalive_connections: Idle connections kept open for reuse
+        
+    Returns:
+        ollama.Client sharing one httpx connection pool
+    """
+    import ollama
+    
+    return ollama.Client(
+        host=base_url,
+        timeout=timeout,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive_connections
+        )
+    )
 
 
 class RAGPipeline:
@@ -11,43 +69,91 @@ class RAGPipeline:
     def __init__(
         self,
         ollama_base_url: str = "http://localhost:11434",
-        model_name: str = "llama3.2"
+        model_name: str = "llama3.2",
+        client: Optional[Any] = None,
+        keep_alive: Optional[str] = None,
+        health_ttl: float = 10.0
     ):
         """Initialize the RAG pipeline.
         
         Args:
             ollama_base_url: Base URL for Ollama API
             model_name: Name of the Ollama model to use
+            client: Shared ollama.Client; one is created if not provided
+            keep_alive: How long Ollama keeps the model (and its prompt
+                cache) loaded after a request, e.g. "1h"
+            health_ttl: Seconds to reuse a check_ollama_available result
         """
         self.ollama_base_url = ollama_base_url
         self.model_name = model_name
-        self.client = ollama.Client(host=ollama_base_url)
+        self.client = client or create_ollama_client(ollama_base_url)
+        self.keep_alive = keep_alive
+        self.health_ttl = health_ttl
+        self._model_available: Optional[bool] = None
+        self._health_cached = False
+        self._health_checked_at = float("-inf")
     
-    def _build_context(self, search_results: Dict) -> str:
-        """Build context string from search results.
+    def _to_columns(self, search_results: Dict) -> Dict[str, List]:
+        """Unpack the first query's results into parallel column lists.
+        
+        Each metadata dict is read once here, so context building and
+        source extraction only index into plain lists.
         
         Args:
             search_results: Results from vector store search
             
         Returns:
-            Formatted context string
+            Dictionary of equal-length lists keyed by column name
         """
         if not search_results['documents'] or not search_results['documents'][0]:
-            return "No relevant context found."
+            return {
+                "documents": [],
+                "filenames": [],
+                "document_ids": [],
+                "chunk_indices": [],
+                "distances": []
+            }
         
-        contexts = []
         documents = search_results['documents'][0]
         metadatas = search_results['metadatas'][0]
+        distances = search_results['distances'][0] if search_results.get('distances') else [0] * len(documents)
         
-        for i, (doc, metadata) in enumerate(zip(documents, metadatas)):
-            context_piece = f"[Source {i+1}: {metadata['filename']}]\n{doc}\n"
-            contexts.append(context_piece)
+        return {
+            "documents": documents,
+            "filenames": [m['filename'] for m in metadatas],
+            "document_ids": [m['document_id'] for m in metadatas],
+            "chunk_indices": [m['chunk_index'] for m in metadatas],
+            "distances": distances
+        }
+    
+    def _build_context(self, columns: Dict[str, List]) -> str:
+        """Build context string from search results.
+        
+        Args:
+            columns: Search results as returned by _to_columns
+            
+        Returns:
+            Formatted context string
+        """
+        documents = columns["documents"]
+        if not documents:
+            return "No relevant context found."
+        
+        filenames = columns["filenames"]
+        contexts = [
+            f"[Source {i + 1}: {filenames[i]}]\n{documents[i]}\n"
+            for i in range(len(documents))
+        ]
         
         return "\n".join(contexts)
     
     def _build_prompt(self, query: str, context: str) -> str:
         """Build the prompt for the LLM.
         
+        The static instructions come first so every prompt shares the same
+        prefix, letting Ollama reuse its cached KV state for that prefix
+        instead of re-running prefill over it on each query.
+        
         Args:
             query: User's question
             context: Retrieved context from documents
@@ -55,22 +161,43 @@ class RAGPipeline:
         Returns:
             Formatted prompt string
         """
-        prompt = f"""You are a helpful AI assistant for an e-commerce platform. Answer the user's question based on the provided context from product documents.
-
-Context from documents:
-{context}
-
-User Question: {query}
-
-Instructions:
-- Answer the question using ONLY the information from the context above
-- If the context doesn't contain enough information to answer, say "I don't have enough information in the documents to answer this question."
-- Be concise and accurate
-- If referencing specific products or features, mention the source document
-
-Answer:"""
+        return "".join((
+            PROMPT_PREAMBLE,
+            PROMPT_CONTEXT_HEADER,
+            context,
+            PROMPT_QUESTION_HEADER,
+            query,
+            PROMPT_ANSWER_SUFFIX
+        ))
+    
+    def _extract_sources(self, columns: Dict[str, List]) -> List[Dict]:
+        """Extract source information from search results.
+        
+        Args:
+            columns: Search results as returned by _to_columns
+            
+        Returns:
+            List of source dictionaries
+        """
+        documents = columns["documents"]
+        filenames = columns["filenames"]
+        document_ids = columns["document_ids"]
+        chunk_indices = columns["chunk_indices"]
+        
+        # Inner-product distance on unit vectors is 1 - cosine similarity
+        scores = [min(1.0, max(0.0, 1.0 - d)) for d in columns["distances"]]
+        previews = [doc[:200] + "..." if len(doc) > 200 else doc for doc in documents]
         
-        return prompt
+        return [
+            {
+                "document_id": document_ids[i],
+                "filename": filenames[i],
+                "chunk_index": chunk_indices[i],
+                "relevance_score": round(scores[i], 3),
+                "content": previews[i]
+            }
+            for i in range(len(documents))
+        ]
     
     def generate_response(
         self,
@@ -86,8 +213,10 @@ Answer:"""
         Returns:
             Dictionary containing answer and metadata
         """
+        columns = self._to_columns(search_results)
+        
         # Build context from retrieved documents
-        context = self._build_context(search_results)
+        context = self._build_context(columns)
         
         # Build prompt
         prompt = self._build_prompt(query, context)
@@ -97,48 +226,82 @@ Answer:"""
             response = self.client.generate(
                 model=self.model_name,
                 prompt=prompt,
-                options={
-                    "temperature": 0.7,
-                    "num_predict": 512,
-                }
+                options=GENERATION_OPTIONS,
+                keep_alive=self.keep_alive
             )
             
             answer = response['response'].strip()
             
         except Exception as e:
-            answer = f"Error generating response: {str(e)}"
-        
-        # Extract source information
-        sources = []
-        if search_results['documents'] and search_results['documents'][0]:
-            documents = search_results['documents'][0]
-            metadatas = search_results['metadatas'][0]
-            distances = search_results['distances'][0] if 'distances' in search_results else [0] * len(documents)
-            
-            for doc, metadata, distance in zip(documents, metadatas, distances):
-                # Convert distance to similarity score (1 - distance for cosine)
-                similarity_score = 1.0 - distance if distance <= 1.0 else 0.0
-                
-                sources.append({
-                    "document_id": metadata['document_id'],
-                    "filename": metadata['filename'],
-                    "chunk_index": metadata['chunk_index'],
-                    "relevance_score": round(similarity_score, 3),
-                    "content": doc[:200] + "..." if len(doc) > 200 else doc
-                })
+            answer = f"{GENERATION_ERROR_PREFIX}: {str(e)}"
         
         return {
             "answer": answer,
-            "sources": sources,
+            "sources": self._extract_sources(columns),
             "query": query,
-            "timestamp": datetime.now().isoformat()
+            "timestamp": now_iso()
         }
     
-    def check_ollama_available(self) -> bool:
-        """Check if Ollama is available and the model exists.
+    def stream_response(
+        self,
+        query: str,
+        search_results: Dict
+    ) -> Iterator[Dict]:
+        """Generate response using RAG, yielding tokens as they are produced.
+        
+        Args:
+            query: User's question
+            search_results: Results from vector store search
+            
+        Yields:
+            {"type": "token", "content": ...} for each generated piece,
+            then a final {"type": "done", ...} event carrying the sources
+        """
+        columns = self._to_columns(search_results)
+        context = self._build_context(columns)
+        prompt = self._build_prompt(query, context)
+        
+        try:
+            for part in self.client.generate(
+                model=self.model_name,
+                prompt=prompt,
+                stream=True,
+                options=GENERATION_OPTIONS,
+                keep_alive=self.keep_alive
+            ):
+                if part.get('response'):
+                    yield {"type": "token", "content": part['response']}
+        except Exception as e:
+            yield {"type": "error", "content": f"{GENERATION_ERROR_PREFIX}: {str(e)}"}
+        
+        yield {
+            "type": "done",
+            "sources": self._extract_sources(columns),
+            "query": query,
+            "timestamp": now_iso()
+        }
+    
+    def warm_up(self):
+        """Load the model into Ollama with a one-token generation.
+        
+        Raises:
+            Exception: If Ollama cannot be reached or the model fails to load
+        """
+        self.client.generate(
+            model=self.model_name,
+            prompt="ok",
+            options={"num_predict": 1},
+            keep_alive=self.keep_alive
+        )
+    
+    def check_model_available(self) -> bool:
+        """Check if Ollama is reachable and the model exists.
+        
+        Fetches the full model list, so it is only used when the model has
+        not yet been confirmed; routine probes use check_ollama_available.
         
         Returns:
-            True if Ollama is available, False otherwise
+            True if the model is available, False otherwise
         """
         try:
             # Try to list models to check connection
@@ -148,13 +311,40 @@ Answer:"""
             model_names = [model['name'] for model in models.get('models', [])]
             
             # Check for exact match or partial match (e.g., llama3.2:latest)
-            model_available = any(
+            self._model_available = any(
                 self.model_name in name or name.startswith(self.model_name)
                 for name in model_names
             )
             
-            return model_available
-            
         except Exception as e:
             print(f"Ollama check failed: {str(e)}")
-            return False
+            self._model_available = None
+        
+        return bool(self._model_available)
+    
+    def check_ollama_available(self) -> bool:
+        """Check if Ollama is available and the model exists.
+        
+        Results are cached for health_ttl seconds. Once the model has been
+        found, later checks only send a HEAD request to confirm Ollama is up.
+        
+        Returns:
+            True if Ollama is available, False otherwise
+        """
+        now = time.monotonic()
+        if now - self._health_checked_at < self.health_ttl:
+            return self._health_cached
+        
+        if not self._model_available:
+            available = self.check_model_available()
+        else:
+            try:
+                response = httpx.head(f"{self.ollama_base_url}/api/tags", timeout=0.5)
+                available = response.is_success
+            except Exception as e:
+                print(f"Ollama check failed: {str(e)}")
+                available = False
+        
+        self._health_cached = available
+        self._health_checked_at = now
+        return available
@@ -0,0 +1,58 @@
+"""Shared service instances used across API routes.
+
+Services are created once at import so the embedding model is loaded a
+single time and all routes share one ChromaDB client and Ollama client.
+"""
+
+import os
+
+from app.config import settings
+from app.services.answer_cache import AnswerCache
+from app.services.document_processor import DocumentProcessor
+from app.services.embeddings import EmbeddingService, EmbeddingBatcher
+from app.services.vector_store import VectorStore
+from app.services.rag_pipeline import RAGPipeline, create_ollama_client
+
+document_processor = DocumentProcessor(
+    chunk_size=settings.chunk_size,
+    chunk_overlap=settings.chunk_overlap,
+    pdf_workers=settings.pdf_workers
+)
+embedding_service = EmbeddingService(
+    model_name=settings.embedding_model,
+    batch_size=settings.embedding_batch_size,
+    backend=settings.embedding_backend,
+    cache_dir=os.path.join(settings.chroma_persist_dir, "models"),
+    query_cache_size=settings.query_embedding_cache_size
+)
+embedding_batcher = EmbeddingBatcher(
+    embedding_service,
+    flush_ms=settings.query_batch_flush_ms,
+    max_batch=settings.query_batch_max_size
+)
+vector_store = VectorStore(
+    persist_directory=settings.chroma_persist_dir,
+    collection_name=settings.chroma_collection_name,
+    hnsw_batch_size=settings.hnsw_batch_size,
+    hnsw_sync_threshold=settings.hnsw_sync_threshold,
+    hnsw_m=settings.hnsw_m,
+    hnsw_construction_ef=settings.hnsw_construction_ef,
+    hnsw_search_ef=settings.hnsw_search_ef or max(32, settings.top_k_results * 8)
+)
+ollama_client = create_ollama_client(
+    settings.ollama_base_url,
+    timeout=settings.ollama_timeout,
+    max_connections=settings.ollama_max_connections,
+    max_keepalive_connections=settings.ollama_max_keepalive_connections
+)
+rag_pipeline = RAGPipeline(
+    ollama_base_url=settings.ollama_base_url,
+    model_name=settings.ollama_model,
+    client=ollama_client,
+    keep_alive=settings.ollama_keep_alive,
+    health_ttl=settings.health_refresh_seconds
+)
+answer_cache = AnswerCache(
+    maxsize=settings.answer_cache_size,
+    ttl=settings.answer_cache_ttl_seconds
+)
@@ -1,25 +1,78 @@
 """Vector store service using ChromaDB."""
 
+import asyncio
+import functools
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
 import chromadb
+import numpy as np
 from chromadb.config import Settings
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Sequence, Tuple, Union
 from datetime import datetime
 
 
+# SQLite side table with one row per document, kept next to the Chroma files
+DOCS_INDEX_FILENAME = "docs_index.db"
+
+# Chunks fetched per page when scanning the collection to rebuild the index
+REBUILD_PAGE_SIZE = 10000
+
+
 class VectorStore:
     """Service for managing document vectors in ChromaDB."""
     
-    def __init__(self, persist_directory: str, collection_name: str = "ecommerce_docs"):
+    def __init__(
+        self,
+        persist_directory: str,
+        collection_name: str = "ecommerce_docs",
+        hnsw_batch_size: int = 1000,
+        hnsw_sync_threshold: int = 10000,
+        hnsw_m: int = 16,
+        hnsw_construction_ef: int = 200,
+        hnsw_search_ef: int = 32,
+        max_workers: int = 2
+    ):
         """Initialize the vector store.
         
         Args:
             persist_directory: Directory for ChromaDB persistence
             collection_name: Name of the ChromaDB collection
+            hnsw_batch_size: Vectors buffered before they are inserted into
+                the HNSW graph
+            hnsw_sync_threshold: Vectors inserted before the HNSW index is
+                persisted to disk
+            hnsw_m: Neighbours per node in the HNSW graph
+            hnsw_construction_ef: Candidate list size while building the graph
+            hnsw_search_ef: Candidate list size while searching; hnswlib
+                never uses less than the requested top_k
+            max_workers: Threads running ChromaDB calls for the async methods
         """
         self.persist_directory = persist_directory
         self.collection_name = collection_name
+        self.hnsw_batch_size = hnsw_batch_size
+        self.hnsw_sync_threshold = hnsw_sync_threshold
+        self.hnsw_m = hnsw_m
+        self.hnsw_construction_ef = hnsw_construction_ef
+        self.hnsw_search_ef = hnsw_search_ef
+        # Chroma has a single writer, so a couple of threads is enough to
+        # keep its native calls off the event loop. The pool is created on
+        # first use so the store can be reused after close().
+        self.max_workers = max_workers
+        self._pool: Optional[ThreadPoolExecutor] = None
         self.client = None
         self.collection = None
+        self._index = None
+        self._index_lock = threading.Lock()
+        # Embedding dimension of the collection, known after the first add
+        self._dim = None
+        # Maintained by add/delete so stats reads never touch ChromaDB
+        self._doc_count = 0
+        self._chunk_count = 0
+        # Bumped on every write so caches keyed on it are invalidated
+        self.version = 0
         self._initialize_client()
     
     def _initialize_client(self):
@@ -31,18 +84,159 @@ class VectorStore:
             path=self.persist_directory
         )
         
-        # Get or create collection
-        self.collection = self.client.get_or_create_collection(
-            name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}  # Use cosine similarity
-        )
+        # HNSW settings are fixed when the index is created; passing them to
+        # an existing collection would only rewrite its metadata, leaving it
+        # out of step with the index actually in use
+        try:
+            self.collection = self.client.get_collection(name=self.collection_name)
+            self._check_index_settings()
+        except ValueError:
+            self.collection = self.client.create_collection(
+                name=self.collection_name,
+                metadata=self._collection_metadata()
+            )
         
         print(f"ChromaDB collection '{self.collection_name}' initialized")
+        
+        self._initialize_index()
+    
+    def _initialize_index(self):
+        """Open the per-document side table, rebuilding it if it is missing.
+        
+        Listing and counting documents read this table instead of scanning
+        every chunk's metadata in the collection.
+        """
+        self._index = sqlite3.connect(
+            os.path.join(self.persist_directory, DOCS_INDEX_FILENAME),
+            check_same_thread=False
+        )
+        with self._index_lock, self._index:
+            # The index file is shared by every collection in the persist
+            # directory, so rows are keyed by collection as well
+            self._index.execute(
+                "CREATE TABLE IF NOT EXISTS documents("
+                "collection TEXT, "
+                "document_id TEXT, "
+                "filename TEXT, "
+                "upload_time TEXT, "
+                "chunk_count INT, "
+                "PRIMARY KEY (collection, document_id))"
+            )
+            indexed = self._index.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?",
+                (self.collection_name,)
+            ).fetchone()[0]
+            self._doc_count = indexed
+        
+        # Collections created before the side table existed are indexed once
+        self._chunk_count = self.collection.count()
+        if self._chunk_count > 0:
+            sample = self.collection.get(limit=1, include=["embeddings"])
+            self._dim = len(sample['embeddings'][0])
+            if indexed == 0:
+                self._rebuild_index()
+    
+    def _rebuild_index(self):
+        """Repopulate the side table from the chunk metadata in the collection."""
+        print("Rebuilding document index from ChromaDB metadata")
+        
+        # Chunks written before metadata was slimmed down still carry the
+        # document-level fields; newer chunks only contribute to the count.
+        # The collection is paged so only one page of metadata is held at once.
+        documents = {}
+        offset = 0
+        while True:
+            page = self.collection.get(
+                limit=REBUILD_PAGE_SIZE,
+                offset=offset,
+                include=["metadatas"]
+            )
+            if not page['metadatas']:
+                break
+            
+            for metadata in page['metadatas']:
+                doc_id = metadata['document_id']
+                if doc_id not in documents:
+                    documents[doc_id] = [
+                        self.collection_name,
+                        doc_id,
+                        metadata.get('filename', ""),
+                        metadata.get('upload_time', ""),
+                        0
+                    ]
+                documents[doc_id][4] += 1
+            
+            offset += REBUILD_PAGE_SIZE
+        
+        with self._index_lock, self._index:
+            self._index.execute(
+                "DELETE FROM documents WHERE collection = ?",
+                (self.collection_name,)
+            )
+            self._index.executemany(
+                "INSERT INTO documents (collection, document_id, filename, upload_time, chunk_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                documents.values()
+            )
+            self._doc_count = len(documents)
+    
+    def _collection_metadata(self) -> Dict:
+        """Build the HNSW index configuration for the collection.
+        
+        Large batch and sync thresholds let bulk ingest insert into the
+        graph and flush the index in a few large steps instead of many.
+        A higher construction ef improves graph quality (and so recall) at
+        build time, while search ef is sized to the top_k actually served
+        rather than traversing more of the graph than needed. All of these
+        are fixed once the collection has been created.
+        
+        Returns:
+            Collection metadata dictionary
+        """
+        return {
+            # Embeddings are L2-normalized, so inner product equals cosine
+            # similarity without a per-candidate norm computation
+            "hnsw:space": "ip",
+            "hnsw:batch_size": self.hnsw_batch_size,
+            "hnsw:sync_threshold": self.hnsw_sync_threshold,
+            "hnsw:M": self.hnsw_m,
+            "hnsw:construction_ef": self.hnsw_construction_ef,
+            "hnsw:search_ef": self.hnsw_search_ef
+        }
+    
+    def _check_index_settings(self):
+        """Warn when an existing collection was built with other HNSW settings."""
+        current = self.collection.metadata or {}
+        differing = [
+            key for key, value in self._collection_metadata().items()
+            if current.get(key) != value
+        ]
+        if differing:
+            print(
+                f"ChromaDB collection '{self.collection_name}' was created with different "
+                f"HNSW settings ({', '.join(differing)}); they only take effect after "
+                f"re-indexing into a new collection"
+            )
+    
+    @staticmethod
+    def _chunk_ids(document_id: str, chunk_count: int) -> List[str]:
+        """Build the ids of a document's chunks.
+        
+        The id prefix is built once rather than formatted per chunk.
+        
+        Args:
+            document_id: Document identifier
+            chunk_count: Number of chunks in the document
+            
+        Returns:
+            Chunk ids in chunk order
+        """
+        return list(map((document_id + "_chunk_").__add__, map(str, range(chunk_count))))
     
     def add_documents(
         self,
         chunks: List[str],
-        embeddings: List[List[float]],
+        embeddings: Union[List[List[float]], np.ndarray],
         document_id: str,
         filename: str,
         upload_time: str
@@ -51,42 +245,124 @@ class VectorStore:
         
         Args:
             chunks: List of text chunks
-            embeddings: List of embedding vectors
+            embeddings: Embedding vectors, one per chunk
             document_id: Unique document identifier
             filename: Original filename
             upload_time: ISO format timestamp of upload
         """
-        if not chunks or not embeddings:
+        self.add_documents_batch([(chunks, embeddings, document_id, filename, upload_time)])
+    
+    def add_documents_batch(
+        self,
+        documents: Sequence[Tuple[List[str], Union[List[List[float]], np.ndarray], str, str, str]]
+    ):
+        """Add the chunks of several documents in a single write.
+        
+        Every document is validated before anything is written, so a bad
+        entry does not leave a partial batch behind in the collection.
+        
+        Args:
+            documents: Tuples of (chunks, embeddings, document_id, filename,
+                upload_time), one per document
+                
+        Raises:
+            ValueError: If a document's embeddings do not match its chunks
+                or the collection's embedding dimension
+        """
+        chunk_ids = []
+        all_chunks = []
+        all_embeddings = []
+        metadatas = []
+        index_rows = []
+        
+        # Bound once outside the per-document loop
+        extend_ids = chunk_ids.extend
+        extend_chunks = all_chunks.extend
+        extend_metadatas = metadatas.extend
+        append_embeddings = all_embeddings.append
+        append_row = index_rows.append
+        chunk_ids_for = self._chunk_ids
+        
+        dim = self._dim
+        for chunks, embeddings, document_id, filename, upload_time in documents:
+            n = len(chunks)
+            if n == 0 and len(embeddings) == 0:
+                continue
+            
+            # One contiguous float32 matrix per document; Chroma takes it as-is
+            # instead of unboxing every element of a nested list
+            embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+            if embeddings.ndim != 2 or embeddings.shape[0] != n:
+                raise ValueError(
+                    f"Document {document_id} has {n} chunks but embeddings of shape {embeddings.shape}"
+                )
+            if dim is None:
+                dim = embeddings.shape[1]
+            elif embeddings.shape[1] != dim:
+                raise ValueError(
+                    f"Document {document_id} has {embeddings.shape[1]}-dimensional embeddings, expected {dim}"
+                )
+            
+            # Create unique IDs and metadata for each chunk
+            extend_ids(chunk_ids_for(document_id, n))
+            # Document-level fields live in the side table, not on every chunk
+            extend_metadatas([{"document_id": document_id, "chunk_index": i} for i in range(n)])
+            extend_chunks(chunks)
+            append_row((self.collection_name, document_id, filename, upload_time, n))
+            append_embeddings(embeddings)
+        
+        total = len(all_chunks)
+        if total == 0:
             return
         
-        # Create unique IDs for each chunk
-        chunk_ids = [f"{document_id}_chunk_{i}" for i in range(len(chunks))]
+        if len(all_embeddings) == 1:
+            embeddings = all_embeddings[0]
+        else:
+            embeddings = np.concatenate(all_embeddings, axis=0)
         
-        # Create metadata for each chunk
-        metadatas = [
-            {
-                "document_id": document_id,
-                "filename": filename,
-                "chunk_index": i,
-                "upload_time": upload_time,
-                "total_chunks": len(chunks)
-            }
-            for i in range(len(chunks))
-        ]
+        # Add all chunks in one call so HNSW insertion and persistence are
+        # amortized; only split when Chroma's per-call limit would be exceeded
+        add = self.collection.add
+        max_batch = self.client.max_batch_size
+        for start in range(0, total, max_batch):
+            end = start + max_batch
+            add(
+                ids=chunk_ids[start:end],
+                embeddings=embeddings[start:end],
+                documents=all_chunks[start:end],
+                metadatas=metadatas[start:end]
+            )
         
-        # Add to collection
-        self.collection.add(
-            ids=chunk_ids,
-            embeddings=embeddings,
-            documents=chunks,
-            metadatas=metadatas
-        )
+        with self._index_lock, self._index:
+            # Chroma ignores adds of ids it already has, so chunks of a
+            # document being replaced must not be counted twice
+            doc_ids = [row[1] for row in index_rows]
+            placeholders = ", ".join("?" * len(doc_ids))
+            replaced_chunks = self._index.execute(
+                "SELECT COALESCE(SUM(chunk_count), 0) FROM documents "
+                f"WHERE collection = ? AND document_id IN ({placeholders})",
+                [self.collection_name, *doc_ids]
+            ).fetchone()[0]
+            
+            self._index.executemany(
+                "INSERT OR REPLACE INTO documents (collection, document_id, filename, upload_time, chunk_count) "
+                "VALUES (?, ?, ?, ?, ?)",
+                index_rows
+            )
+            # Recounted rather than incremented in case a document was replaced
+            self._doc_count = self._index.execute(
+                "SELECT COUNT(*) FROM documents WHERE collection = ?",
+                (self.collection_name,)
+            ).fetchone()[0]
+            self._chunk_count += total - replaced_chunks
+            self.version += 1
         
-        print(f"Added {len(chunks)} chunks for document {document_id}")
+        self._dim = dim
+        print(f"Added {total} chunks for {len(index_rows)} document(s)")
     
     def search(
         self,
-        query_embedding: List[float],
+        query_embedding: Union[List[float], np.ndarray],
         top_k: int = 3
     ) -> Dict:
         """Search for similar documents using vector similarity.
@@ -98,36 +374,101 @@ class VectorStore:
         Returns:
             Dictionary with search results
         """
+        return self.search_batch(
+            np.asarray(query_embedding, dtype=np.float32).reshape(1, -1),
+            top_k=top_k
+        )
+    
+    def search_batch(
+        self,
+        query_embeddings: Union[List[List[float]], np.ndarray],
+        top_k: int = 3
+    ) -> Dict:
+        """Search for several query vectors in one call.
+        
+        Args:
+            query_embeddings: Query vectors, one per row
+            top_k: Number of results to return per query
+            
+        Returns:
+            Dictionary with one row of search results per query
+        """
         results = self.collection.query(
-            query_embeddings=[query_embedding],
+            query_embeddings=np.ascontiguousarray(query_embeddings, dtype=np.float32),
             n_results=top_k
         )
         
+        self._attach_filenames(results)
         return results
     
+    def _attach_filenames(self, results: Dict):
+        """Fill in each hit's filename from the document side table.
+        
+        Args:
+            results: Query results whose metadatas are updated in place
+        """
+        hits = [m for row in results.get('metadatas') or [] for m in row or []]
+        if not hits:
+            return
+        
+        doc_ids = list({m['document_id'] for m in hits})
+        placeholders = ", ".join("?" * len(doc_ids))
+        with self._index_lock:
+            filenames = dict(self._index.execute(
+                "SELECT document_id, filename FROM documents "
+                f"WHERE collection = ? AND document_id IN ({placeholders})",
+                [self.collection_name, *doc_ids]
+            ).fetchall())
+        
+        for metadata in hits:
+            metadata['filename'] = filenames.get(metadata['document_id'], metadata.get('filename', ""))
+    
     def delete_document(self, document_id: str) -> int:
         """Delete all chunks associated with a document.
         
+        Chunk ids are derived from the document's row in the side table, so
+        the delete goes straight to Chroma's id index instead of filtering
+        chunk metadata.
+        
         Args:
             document_id: Document identifier to delete
             
         Returns:
             Number of chunks deleted
         """
-        # Query all chunks with this document_id
-        results = self.collection.get(
-            where={"document_id": document_id}
-        )
+        document = self.get_document(document_id)
+        if document is not None:
+            # Chroma only logs deletes of missing ids, so keep the ids it has
+            chunk_ids = self.collection.get(
+                ids=self._chunk_ids(document_id, document['chunk_count']),
+                include=[]
+            )['ids']
+        else:
+            # Not in the side table; fall back to a metadata lookup of the ids
+            chunk_ids = self.collection.get(
+                where={"document_id": document_id},
+                include=[]
+            )['ids']
         
-        if not results['ids']:
+        if chunk_ids:
+            # Delete all matching chunks
+            self.collection.delete(
+                ids=chunk_ids
+            )
+        elif document is None:
             return 0
         
-        # Delete all matching chunks
-        self.collection.delete(
-            ids=results['ids']
-        )
+        with self._index_lock, self._index:
+            self._index.execute(
+                "DELETE FROM documents WHERE collection = ? AND document_id = ?",
+                (self.collection_name, document_id)
+            )
+            if document is not None:
+                self._doc_count -= 1
+            self._chunk_count -= len(chunk_ids)
+            self.version += 1
         
-        deleted_count = len(results['ids'])
+        deleted_count = len(chunk_ids)
         print(f"Deleted {deleted_count} chunks for document {document_id}")
         
         return deleted_count
@@ -138,25 +479,48 @@ class VectorStore:
         Returns:
             List of document metadata dictionaries
         """
-        # Get all items from collection
-        all_items = self.collection.get()
+        with self._index_lock:
+            rows = self._index.execute(
+                "SELECT document_id, filename, upload_time, chunk_count FROM documents "
+                "WHERE collection = ?",
+                (self.collection_name,)
+            ).fetchall()
         
-        if not all_items['metadatas']:
-            return []
+        return [
+            {
+                "document_id": doc_id,
+                "filename": filename,
+                "upload_time": upload_time,
+                "chunk_count": chunk_count
+            }
+            for doc_id, filename, upload_time, chunk_count in rows
+        ]
+    
+    def get_document(self, document_id: str) -> Optional[Dict]:
+        """Look up a single document in the side table.
         
-        # Group by document_id
-        documents = {}
-        for metadata in all_items['metadatas']:
-            doc_id = metadata['document_id']
-            if doc_id not in documents:
-                documents[doc_id] = {
-                    "document_id": doc_id,
-                    "filename": metadata['filename'],
-                    "upload_time": metadata['upload_time'],
-                    "chunk_count": metadata.get('total_chunks', 0)
-                }
-        
-        return list(documents.values())
+        Args:
+            document_id: Document identifier
+            
+        Returns:
+            Document metadata dictionary, or None if it is not indexed
+        """
+        with self._index_lock:
+            row = self._index.execute(
+                "SELECT document_id, filename, upload_time, chunk_count FROM documents "
+                "WHERE collection = ? AND document_id = ?",
+                (self.collection_name, document_id)
+            ).fetchone()
+        
+        if row is None:
+            return None
+        
+        return {
+            "document_id": row[0],
+            "filename": row[1],
+            "upload_time": row[2],
+            "chunk_count": row[3]
+        }
     
     def get_document_count(self) -> int:
         """Get total number of unique documents.
@@ -164,7 +528,7 @@ class VectorStore:
         Returns:
             Number of documents
         """
-        return len(self.list_documents())
+        return self._doc_count
     
     def get_chunk_count(self) -> int:
         """Get total number of chunks in the collection.
@@ -172,4 +536,52 @@ class VectorStore:
         Returns:
             Number of chunks
         """
-        return self.collection.count()
+        return self._chunk_count
+    
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking method on the ChromaDB thread pool.
+        
+        Args:
+            func: Method to call
+            *args: Positional arguments for func
+            **kwargs: Keyword arguments for func
+            
+        Returns:
+            Whatever func returns
+        """
+        if self._pool is None:
+            self._pool = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="chroma"
+            )
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._pool, functools.partial(func, *args, **kwargs))
+    
+    async def aadd_documents(self, *args, **kwargs):
+        """Async variant of add_documents, run on the ChromaDB thread pool."""
+        return await self._run(self.add_documents, *args, **kwargs)
+    
+    async def aadd_documents_batch(self, *args, **kwargs):
+        """Async variant of add_documents_batch, run on the ChromaDB thread pool."""
+        return await self._run(self.add_documents_batch, *args, **kwargs)
+    
+    async def asearch(self, *args, **kwargs) -> Dict:
+        """Async variant of search, run on the ChromaDB thread pool."""
+        return await self._run(self.search, *args, **kwargs)
+    
+    async def asearch_batch(self, *args, **kwargs) -> Dict:
+        """Async variant of search_batch, run on the ChromaDB thread pool."""
+        return await self._run(self.search_batch, *args, **kwargs)
+    
+    async def adelete_document(self, *args, **kwargs) -> int:
+        """Async variant of delete_document, run on the ChromaDB thread pool."""
+        return await self._run(self.delete_document, *args, **kwargs)
+    
+    def close(self):
+        """Wait for pending ChromaDB calls and stop the thread pool.
+        
+        The next async call starts a new pool.
+        """
+        if self._pool is not None:
+            self._pool.shutdown(wait=True)
+            self._pool = None
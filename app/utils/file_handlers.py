@@ -1,21 +1,32 @@
 """Utility functions for file handling."""
 
+import hashlib
 import os
-import uuid
 from typing import Tuple
+
+import aiofiles
 from fastapi import UploadFile, HTTPException
 
 
-ALLOWED_EXTENSIONS = {'.txt', '.md', '.pdf'}
+ALLOWED_EXTENSIONS = frozenset({'.txt', '.md', '.pdf'})
+
+# Uploads are read and written in pieces of this size so the event loop
+# is yielded between them
+UPLOAD_CHUNK_SIZE = 1 << 20
 
 
-def generate_document_id() -> str:
-    """Generate a unique document ID using UUID4.
+def generate_document_id(content_hash: str) -> str:
+    """Derive a document ID from the hash of the document contents.
+    
+    Identical uploads get the same ID, so re-uploads can be detected.
     
+    Args:
+        content_hash: Hex SHA-256 digest of the file contents
+        
     Returns:
-        str: Unique document identifier
+        str: Document identifier (the first 32 hex digits of the digest)
     """
-    return str(uuid.uuid4())
+    return content_hash[:32]
 
 
 def validate_file_extension(filename: str) -> bool:
@@ -27,22 +38,26 @@ def validate_file_extension(filename: str) -> bool:
     Returns:
         bool: True if extension is allowed, False otherwise
     """
-    _, ext = os.path.splitext(filename.lower())
-    return ext in ALLOWED_EXTENSIONS
+    # Split the same way the document processor does, so names such as
+    # ".txt" that it sees as extensionless are rejected here too; only the
+    # extension is lowercased, not the whole filename
+    return os.path.splitext(filename)[1].lower() in ALLOWED_EXTENSIONS
 
 
-async def save_upload_file(upload_file: UploadFile, upload_dir: str) -> Tuple[str, str]:
-    """Save uploaded file to disk.
+async def read_upload_file(upload_file: UploadFile) -> Tuple[bytearray, str]:
+    """Read an uploaded file into memory in fixed-size chunks.
+    
+    A SHA-256 digest of the contents is computed during the same pass
+    and used to derive the document ID.
     
     Args:
         upload_file: FastAPI UploadFile object
-        upload_dir: Directory to save the file
         
     Returns:
-        Tuple of (file_path, document_id)
+        Tuple of (file contents, document_id)
         
     Raises:
-        HTTPException: If file extension not allowed or save fails
+        HTTPException: If file extension not allowed or read fails
     """
     # Validate file extension
     if not validate_file_extension(upload_file.filename):
@@ -51,45 +66,48 @@ async def save_upload_file(upload_file: UploadFile, upload_dir: str) -> Tuple[st
             detail=f"File type not supported. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
     
-    # Generate unique document ID
-    doc_id = generate_document_id()
-    
-    # Create upload directory if it doesn't exist
-    os.makedirs(upload_dir, exist_ok=True)
-    
-    # Save file with document ID as prefix
-    file_extension = os.path.splitext(upload_file.filename)[1]
-    filename = f"{doc_id}{file_extension}"
-    file_path = os.path.join(upload_dir, filename)
-    
     try:
-        # Write file to disk
-        with open(file_path, "wb") as f:
-            content = await upload_file.read()
-            f.write(content)
+        digest = hashlib.sha256()
+        buffer = bytearray()
+        while True:
+            chunk = await upload_file.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            buffer += chunk
         
-        return file_path, doc_id
+        # Returned as-is; converting to bytes would copy the whole file again
+        return buffer, generate_document_id(digest.hexdigest())
     
     except Exception as e:
         raise HTTPException(
             status_code=500,
-            detail=f"Failed to save file: {str(e)}"
+            detail=f"Failed to read file: {str(e)}"
         )
 
 
-def delete_upload_file(file_path: str) -> bool:
-    """Delete uploaded file from disk.
+async def save_upload_bytes(data: bytearray, upload_dir: str, document_id: str, filename: str) -> str:
+    """Save uploaded file contents to disk.
     
     Args:
-        file_path: Path to the file to delete
+        data: Raw file contents
+        upload_dir: Directory to save the file
+        document_id: Document ID used as the stored file name
+        filename: Original filename, used for its extension
         
     Returns:
-        bool: True if deletion successful, False otherwise
+        str: Path of the saved file
     """
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            return True
-        return False
-    except Exception:
-        return False
+    # Create upload directory if it doesn't exist
+    os.makedirs(upload_dir, exist_ok=True)
+    
+    # Save file with document ID as prefix
+    file_extension = os.path.splitext(filename)[1]
+    file_path = os.path.join(upload_dir, f"{document_id}{file_extension}")
+    
+    view = memoryview(data)
+    async with aiofiles.open(file_path, "wb") as f:
+        for start in range(0, len(view), UPLOAD_CHUNK_SIZE):
+            await f.write(view[start:start + UPLOAD_CHUNK_SIZE])
+    
+    return file_path
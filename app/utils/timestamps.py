@@ -0,0 +1,58 @@
+"""Cached wall-clock timestamps for response payloads."""
+
+import asyncio
+from datetime import datetime
+from typing import Optional
+
+
+class _TimestampState:
+    """Most recent ISO timestamp and the task that refreshes it."""
+    
+    def __init__(self):
+        self.iso = datetime.now().isoformat(timespec="seconds")
+        self.task: Optional[asyncio.Task] = None
+
+
+_state = _TimestampState()
+
+
+def now_iso() -> str:
+    """Get the current time as an ISO 8601 string at second resolution.
+    
+    While the refresher is running this is a single attribute read;
+    otherwise the current time is formatted on demand.
+    
+    Returns:
+        str: ISO formatted timestamp
+    """
+    if _state.task is not None:
+        return _state.iso
+    return datetime.now().isoformat(timespec="seconds")
+
+
+async def _refresh_forever(interval: float):
+    """Update the cached timestamp every interval seconds."""
+    while True:
+        _state.iso = datetime.now().isoformat(timespec="seconds")
+        await asyncio.sleep(interval)
+
+
+def start_refresher(interval: float = 1.0):
+    """Start refreshing the cached timestamp in the background.
+    
+    Args:
+        interval: Seconds between refreshes
+    """
+    if _state.task is None:
+        _state.task = asyncio.create_task(_refresh_forever(interval))
+
+
+async def stop_refresher():
+    """Stop the background refresher."""
+    task, _state.task = _state.task, None
+    if task is not None:
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass